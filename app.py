@@ -1,6 +1,7 @@
 import streamlit as st
 import time
 import random
+from concurrent.futures import ThreadPoolExecutor
 
 # --------------------------------------------------------------------------
 # 1. 模拟后端逻辑
@@ -11,158 +12,240 @@ DEVICE_NAMES = ["机器人", "设备1", "设备2", "设备3", "设备4"]
 POSSIBLE_STATUSES = {
     "空闲": "success", "运行中": "info", "维护中": "warning", "故障": "error"
 }
+# 预先固化为元组，避免每次循环都重建 list(POSSIBLE_STATUSES.keys())
+_STATUS_KEYS = tuple(POSSIBLE_STATUSES)
 
+@st.cache_data(ttl=2.0, show_spinner=False)
 def get_all_device_statuses():
-    """模拟获取所有设备的状态。"""
-    statuses = []
-    for name in DEVICE_NAMES:
-        status_key = random.choice(list(POSSIBLE_STATUSES.keys()))
-        statuses.append({
-            "name": name, "status": status_key, "type": POSSIBLE_STATUSES[status_key],
-            "value": round(random.uniform(0, 100), 2)
-        })
-    return statuses
+    """模拟获取所有设备的状态。
+
+    结果缓存2秒：期间的控件交互重跑会复用上一份快照，
+    只有监控 fragment 的下一次自动刷新才重新生成。
+    """
+    # 一次性批量抽取状态和利用率，避免每个设备两次独立的 random 调用
+    keys = random.choices(_STATUS_KEYS, k=len(DEVICE_NAMES))
+    values = [round(random.random() * 100, 2) for _ in DEVICE_NAMES]
+    return [
+        {"name": name, "status": key, "type": POSSIBLE_STATUSES[key], "value": value}
+        for name, key, value in zip(DEVICE_NAMES, keys, values)
+    ]
 
 # --- 新增：任务状态模拟 ---
 TASK_STEPS = ["等待指令", "抓取物料", "移动至设备1", "执行加工", "移动至设备2", "放置物料", "任务完成"]
+# 预先生成 (上一步, 当前步, 下一步) 三元组，省去每次调用的下标计算
+_STEP_TRIPLES = tuple(
+    (TASK_STEPS[i - 1], TASK_STEPS[i], TASK_STEPS[i + 1])
+    for i in range(1, len(TASK_STEPS) - 1)
+)
 
+@st.cache_data(ttl=2.0, show_spinner=False)
 def get_current_task_status():
-    """模拟获取当前活动任务的状态。"""
+    """模拟获取当前活动任务的状态。(缓存2秒，同上)"""
     # 模拟有时没有任务的情况
     if random.random() < 0.2:
         return None
 
-    current_step_index = random.randint(1, len(TASK_STEPS) - 2)
+    prev_step, current_step, next_step = random.choice(_STEP_TRIPLES)
     total_seconds = random.randint(30, 300)
-    step_seconds = random.randint(5, total_seconds if total_seconds > 5 else 6)
+    step_seconds = random.randint(5, total_seconds)
 
     return {
         "material_info": f"物料批次 #{random.randint(202500, 202599)}",
-        "prev_step": TASK_STEPS[current_step_index - 1],
-        "current_step": TASK_STEPS[current_step_index],
-        "next_step": TASK_STEPS[current_step_index + 1],
+        "prev_step": prev_step,
+        "current_step": current_step,
+        "next_step": next_step,
         "total_time": total_seconds,
         "step_time": step_seconds
     }
 
-def send_task_command(task_name, target_device, params, command):
-    """模拟发送任务指令。"""
+@st.cache_resource
+def _get_cmd_executor():
+    """后台发送指令用的线程池，避免 0.5s 的模拟网络延迟阻塞脚本线程。
+
+    cache_resource 保证整个进程只建一个池，脚本重跑不会再孤儿化旧池。
+    """
+    return ThreadPoolExecutor(max_workers=2)
+
+def _do_send_task_command(task_name, target_device, params, command):
+    """实际的发送逻辑 (在后台线程中执行)。"""
     print(f"指令已发送: [命令: {command}] -> [目标: {target_device}] -> [任务: {task_name}] -> [参数: {params}]")
     time.sleep(0.5)
-    return (True, f"指令 '{command}' 已成功发送！") if random.random() > 0.1 else (False, "指令发送失败！")
+    return random.random() > 0.1
+
+def send_task_command(task_name, target_device, params, command):
+    """模拟发送任务指令。发送在后台线程进行，立即返回不阻塞UI。"""
+    _get_cmd_executor().submit(_do_send_task_command, task_name, target_device, params, command)
+    return True, f"指令 '{command}' 已发送！"
 
 # --------------------------------------------------------------------------
 # 2. UI 辅助函数
 # --------------------------------------------------------------------------
 
+# 0..3599 秒的 MM:SS 字符串查表，渲染热路径上免去整除+格式化
+_MMSS_CACHE = tuple(f"{s // 60:02d}:{s % 60:02d}" for s in range(3600))
+
 def format_seconds_to_ms(seconds):
     """将秒格式化为 MM:SS 格式。"""
-    minutes = seconds // 60
-    secs = seconds % 60
-    return f"{minutes:02d}:{secs:02d}"
+    if 0 <= seconds < 3600:
+        return _MMSS_CACHE[seconds]
+    return f"{seconds // 60:02d}:{seconds % 60:02d}"
 
-def display_device_status(device_info):
-    """渲染一个设备状态卡片。"""
-    internal_status_type = device_info.get("type", "info")
-    status_map = {"info": "running", "success": "complete", "warning": "complete", "error": "error"}
-    st_status_state = status_map.get(internal_status_type, "running")
+# 内部状态类型 -> st.status 的 state 参数，模块级常量避免每张卡片重建
+_STATUS_STATE_MAP = {"info": "running", "success": "complete", "warning": "complete", "error": "error"}
 
-    st.metric(
+def _update_device_metric(placeholder, device_info):
+    """把设备指标写入占位符 (首次渲染和实时模式原地刷新共用)。"""
+    placeholder.metric(
         label=f"**{device_info['name']}**", value=device_info['status'],
         delta=f"利用率: {device_info.get('value', 'N/A')}%", delta_color="off"
     )
+
+def display_device_status(device_info, now_str):
+    """渲染一个设备状态卡片，返回包住指标的占位符供原地刷新。
+
+    只有指标放在 st.empty() 里，详细信息框在占位符之外，
+    这样原地刷新指标不会把详细信息框顶掉。
+    now_str 由调用方每次刷新只计算一次。
+    """
+    internal_status_type = device_info.get("type", "info")
+    st_status_state = _STATUS_STATE_MAP.get(internal_status_type, "running")
+
+    metric_placeholder = st.empty()
+    _update_device_metric(metric_placeholder, device_info)
     with st.status(f"详细信息", state=st_status_state, expanded=False):
-        st.write(f"最后更新: {time.strftime('%H:%M:%S')}")
+        st.write(f"最后更新: {now_str}")
         st.write(f"模式: 自动")
+    return metric_placeholder
+
+# --------------------------------------------------------------------------
+# 3. 页面分区 (fragment)
+# --------------------------------------------------------------------------
+# 每个区块封装为 @st.fragment，刷新时只重跑自己而不是整个脚本：
+# 两个监控区块通过 run_every 自动刷新，控制区块仅在交互时重跑。
+
+@st.fragment(run_every="2s")
+def render_task_panel():
+    """第一部分: 任务实时状态 (每2秒自动刷新)。"""
+    st.header("任务实时状态")
+
+    # 获取当前任务状态
+    task_status = get_current_task_status()
+
+    # 使用带边框的容器来包裹任务状态，使其更突出
+    with st.container(border=True):
+        if task_status:
+            # 第一行：物料信息
+            st.info(f"**当前物料信息**: {task_status['material_info']}", icon="📦")
+
+            # 第二行：任务流程和计时
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                st.markdown("##### 任务流程")
+                st.markdown(
+                    f"<span style='color: gray;'>{task_status['prev_step']}</span> → "
+                    f"**<span style='font-size: 1.1em;'>{task_status['current_step']}</span>** → "
+                    f"<span style='color: gray;'>{task_status['next_step']}</span>",
+                    unsafe_allow_html=True
+                )
+            with col2:
+                st.metric(
+                    label="总用时",
+                    value=format_seconds_to_ms(task_status['total_time'])
+                )
+            with col3:
+                st.metric(
+                    label="当前步骤用时",
+                    value=format_seconds_to_ms(task_status['step_time'])
+                )
+        else:
+            st.info("当前无活动任务。", icon="💤")
+
+
+# 实时模式下占位符原地刷新的轮数，用完后由 fragment 正常重跑接管。
+# 循环会占住会话的脚本线程 (期间其他面板不响应)，所以窗口保持在10秒内
+_LIVE_TICKS = 5
+
+@st.fragment(run_every="2s")
+def render_device_panel():
+    """第二部分: 设备状态监控 (每2秒自动刷新)。
+
+    实时模式下每个指标放进 st.empty() 占位符，循环中只调用
+    placeholder.metric() 原地替换数值，不重建整个控件树。
+    """
+    st.header("设备状态监控")
+
+    current_statuses = get_all_device_statuses()
+    columns = st.columns(len(DEVICE_NAMES))
+
+    now_str = time.strftime('%H:%M:%S')  # 每次刷新只取一次时间
+    placeholders = []
+    for col, device_info in zip(columns, current_statuses):
+        with col:
+            placeholders.append(display_device_status(device_info, now_str))
+
+    if st.session_state.get("live_mode"):
+        for _ in range(_LIVE_TICKS):
+            time.sleep(2)
+            for placeholder, device_info in zip(placeholders, get_all_device_statuses()):
+                _update_device_metric(placeholder, device_info)
+
+
+def _debounce_command():
+    """忽略 500ms 内的重复点击，防止连点堆积指令。"""
+    now = time.monotonic()
+    if now - st.session_state.get("last_cmd_ts", 0.0) < 0.5:
+        st.toast("操作过快，已忽略重复点击。", icon="⏳")
+        st.stop()
+    st.session_state["last_cmd_ts"] = now
+
+
+@st.fragment
+def render_control_panel():
+    """第三部分: 任务下发控制 (仅交互时重跑，不触发监控区刷新)。"""
+    st.header("任务下发控制")
+
+    col1, col2 = st.columns(2)
+    with col1:
+        task_name_input = st.text_input("任务名称", placeholder="例如：执行A物料搬运")
+    with col2:
+        target_device_input = st.selectbox("选择目标设备", options=DEVICE_NAMES)
+    task_params_input = st.slider("任务参数 (示例)", min_value=1, max_value=10, value=5)
+
+    btn_col1, btn_col2, btn_col3, _ = st.columns([1, 1, 1, 3])
+    with btn_col1:
+        if st.button("🚀 下发任务", use_container_width=True, type="primary"):
+            _debounce_command()
+            if task_name_input:
+                success, message = send_task_command(task_name_input, target_device_input, task_params_input, "START")
+                st.toast(f"✅ {message}" if success else f"❌ {message}", icon="✅" if success else "❌")
+            else:
+                st.warning("请输入任务名称！")
+    with btn_col2:
+        if st.button("⏸️ 暂停任务", use_container_width=True):
+            _debounce_command()
+            success, message = send_task_command("N/A", target_device_input, "N/A", "PAUSE")
+            st.toast(f"⏸️ {message}" if success else f"❌ {message}", icon="⏸️" if success else "❌")
+    with btn_col3:
+        if st.button("⏹️ 停止任务", use_container_width=True):
+            _debounce_command()
+            success, message = send_task_command("N/A", target_device_input, "N/A", "STOP")
+            st.toast(f"⏹️ {message}" if success else f"❌ {message}", icon="⏹️" if success else "❌")
 
 # --------------------------------------------------------------------------
-# 3. 主应用逻辑
+# 4. 主应用逻辑
 # --------------------------------------------------------------------------
 
 st.set_page_config(layout="wide", page_title="设备监控与任务下发系统")
 st.title("🤖 设备监控和任务下发系统")
 st.markdown("---")
 
-# --- 新增：第一部分: 任务实时状态 ---
-st.header("任务实时状态")
-
-# 获取当前任务状态
-task_status = get_current_task_status()
-
-# 使用带边框的容器来包裹任务状态，使其更突出
-with st.container(border=True):
-    if task_status:
-        # 第一行：物料信息
-        st.info(f"**当前物料信息**: {task_status['material_info']}", icon="📦")
-
-        # 第二行：任务流程和计时
-        col1, col2, col3 = st.columns(3)
-        with col1:
-            st.markdown("##### 任务流程")
-            st.markdown(
-                f"<span style='color: gray;'>{task_status['prev_step']}</span> → "
-                f"**<span style='font-size: 1.1em;'>{task_status['current_step']}</span>** → "
-                f"<span style='color: gray;'>{task_status['next_step']}</span>",
-                unsafe_allow_html=True
-            )
-        with col2:
-            st.metric(
-                label="总用时",
-                value=format_seconds_to_ms(task_status['total_time'])
-            )
-        with col3:
-            st.metric(
-                label="当前步骤用时",
-                value=format_seconds_to_ms(task_status['step_time'])
-            )
-    else:
-        st.info("当前无活动任务。", icon="💤")
-
+render_task_panel()
 st.markdown("---")
-
-
-# --- 第二部分: 设备状态监控 ---
-st.header("设备状态监控")
-
-current_statuses = get_all_device_statuses()
-columns = st.columns(len(DEVICE_NAMES))
-
-for i, col in enumerate(columns):
-    with col:
-        display_device_status(current_statuses[i])
-
+render_device_panel()
 st.markdown("---")
-
-
-# --- 第三部分: 任务下发控制 ---
-st.header("任务下发控制")
-
-col1, col2 = st.columns(2)
-with col1:
-    task_name_input = st.text_input("任务名称", placeholder="例如：执行A物料搬运")
-with col2:
-    target_device_input = st.selectbox("选择目标设备", options=DEVICE_NAMES)
-task_params_input = st.slider("任务参数 (示例)", min_value=1, max_value=10, value=5)
-
-btn_col1, btn_col2, btn_col3, _ = st.columns([1, 1, 1, 3])
-with btn_col1:
-    if st.button("🚀 下发任务", use_container_width=True, type="primary"):
-        if task_name_input:
-            success, message = send_task_command(task_name_input, target_device_input, task_params_input, "START")
-            st.toast(f"✅ {message}" if success else f"❌ {message}", icon="✅" if success else "❌")
-        else:
-            st.warning("请输入任务名称！")
-with btn_col2:
-    if st.button("⏸️ 暂停任务", use_container_width=True):
-        success, message = send_task_command("N/A", target_device_input, "N/A", "PAUSE")
-        st.toast(f"⏸️ {message}" if success else f"❌ {message}", icon="⏸️" if success else "❌")
-with btn_col3:
-    if st.button("⏹️ 停止任务", use_container_width=True):
-        success, message = send_task_command("N/A", target_device_input, "N/A", "STOP")
-        st.toast(f"⏹️ {message}" if success else f"❌ {message}", icon="⏹️" if success else "❌")
+render_control_panel()
 
 # --- 侧边栏 ---
 with st.sidebar:
-    st.info("这是一个模拟系统。点击下方按钮手动刷新状态。")
-    if st.button("🔄 刷新状态"):
-        st.rerun()
\ No newline at end of file
+    st.info("这是一个模拟系统。监控面板每2秒自动刷新。")
+    st.toggle("⚡ 实时模式 (原地刷新指标，期间其他面板暂停响应)", key="live_mode")
\ No newline at end of file
@@ -1,89 +1,186 @@
 # main.py
 
 import uvicorn
-from fastapi import FastAPI, HTTPException, status, Body
+from fastapi import FastAPI, HTTPException, status, Body, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import ORJSONResponse
 from typing import List, Optional
+import asyncio
+import logging
+import os
 import uuid
 import random
 import time
-from pydantic import BaseModel, Field, model_validator
+import numpy as np
+
+try:
+    import redis.asyncio as redis_asyncio  # 可选依赖：多 worker 部署时共享状态
+except ImportError:
+    redis_asyncio = None
+
+try:
+    import uvloop    # noqa: F401  可选依赖：更快的事件循环/HTTP解析器
+    import httptools # noqa: F401
+    _UVICORN_LOOP, _UVICORN_HTTP = "uvloop", "httptools"
+except ImportError:
+    _UVICORN_LOOP, _UVICORN_HTTP = "auto", "auto"
+from pydantic import TypeAdapter
 from enum import Enum
 
 # --- 1. Pydantic 数据模型 (从 schemas.py 导入) ---
-# (为了方便，直接将上面定义的模型粘贴在这里)
-# --- 设备模型 ---
-class DeviceStatus(BaseModel):
-    name: str = Field(..., description="设备名称", examples=["机器人"])
-    status: str = Field(..., description="可读的状态", examples=["运行中"])
-    type: str = Field(..., description="用于前端判断的状态类型", examples=["info"])
-    value: float = Field(..., description="设备利用率或其他数值", examples=[75.5])
-
-# --- 任务状态枚举 ---
-class TaskState(str, Enum):
-    PAUSED = "paused"
-    STOPPED = "stopped"
-    RUNNING = "running"
-
-# --- 任务模型 ---
-class ActiveTask(BaseModel):
-    task_id: str = Field(..., description="任务的唯一ID", examples=[str(uuid.uuid4())])
-    material_info: str = Field(..., description="当前物料信息", examples=["物料批次 #202533"])
-    prev_step: str
-    current_step: str
-    next_step: str
-    total_time: int = Field(..., description="总运行时长 (秒)")
-    step_time: int = Field(..., description="当前步骤用时 (秒)")
-
-class TaskInfo(ActiveTask):
-    state: TaskState
-    task_name: str
-    target_device: str
-
-# --- API 请求体模型 ---
-class TaskCreate(BaseModel):
-    task_name: str = Field(..., min_length=1, examples=["执行A物料搬运"])
-    target_device: str = Field(..., examples=["设备1"])
-    params: int = Field(..., examples=[5])
-
-class TaskStateUpdate(BaseModel):
-    state: TaskState
-
-    @model_validator(mode='after')
-    def check_state(self):
-        if self.state not in [TaskState.PAUSED, TaskState.STOPPED]:
-            raise ValueError("State must be either 'paused' or 'stopped'")
-        return self
+from schemas import DeviceStatus, TaskState, ActiveTask, TaskInfo, TaskCreate, TaskStateUpdate
 
 
 # --- 2. 模拟数据库和业务逻辑 ---
-# 使用一个简单的字典来模拟数据库和当前状态
+# 使用一个简单的字典来模拟数据库和当前状态。
+# 设备状态按列存储 (SoA)：每个字段一个并行数组，方便模拟器整列批量更新。
+_DEVICE_NAMES = ("机器人", "设备1", "设备2", "设备3", "设备4")
+_N_DEVICES = len(_DEVICE_NAMES)
 DB = {
     "active_task": None,  # 存储当前唯一的活动任务
-    "devices": [
-        {"name": "机器人", "status": "空闲", "type": "success", "value": 10.5},
-        {"name": "设备1", "status": "空闲", "type": "success", "value": 5.2},
-        {"name": "设备2", "status": "空闲", "type": "success", "value": 0.0},
-        {"name": "设备3", "status": "空闲", "type": "success", "value": 1.2},
-        {"name": "设备4", "status": "空闲", "type": "success", "value": 0.5},
-    ]
+    "devices": {
+        "name": np.array(_DEVICE_NAMES, dtype=object),
+        "status": np.array(["空闲"] * _N_DEVICES, dtype=object),
+        "type": np.array(["success"] * _N_DEVICES, dtype=object),
+        "value": np.array([10.5, 5.2, 0.0, 1.2, 0.5]),
+    },
 }
+
+def _device_dicts():
+    """把列式设备状态转回逐设备的字典列表 (API 响应格式)。"""
+    d = DB["devices"]
+    return [
+        {"name": name, "status": status, "type": type_, "value": float(value)}
+        for name, status, type_, value in zip(d["name"], d["status"], d["type"], d["value"])
+    ]
+
+# --- 活动任务存储 ---
+# 设置 MISSION_REDIS_URL (并安装 redis) 时活动任务存入 Redis：
+# 多 worker 共享同一个任务槽位，占用和计时都是原子操作；
+# 否则退回进程内的 DB 字典。设备状态是每进程独立的随机模拟，保持进程内。
+REDIS_URL = os.environ.get("MISSION_REDIS_URL", "")
+_redis = redis_asyncio.from_url(REDIS_URL, decode_responses=True) if (redis_asyncio and REDIS_URL) else None
+_ACTIVE_TASK_KEY = "mission:active_task"
+_SIM_TICK_KEY = "mission:sim_tick"
+_TASK_INT_FIELDS = ("total_time", "step_time")
+# 完整任务哈希必须具备的字段；缺任何一个都视为竞态留下的残缺哈希
+_TASK_REQUIRED_FIELDS = ("task_id", "state") + _TASK_INT_FIELDS
+
+# 进程内模式下保护 active_task 的 check-and-set：
+# 没有锁时两个并发 POST 可能都看到空槽位并互相覆盖
+_task_lock = asyncio.Lock()
+
+async def _get_active_task():
+    """读取当前活动任务，没有则返回 None。"""
+    if _redis is None:
+        return DB["active_task"]
+    data = await _redis.hgetall(_ACTIVE_TASK_KEY)
+    if not data:
+        return None
+    if any(field not in data for field in _TASK_REQUIRED_FIELDS):
+        # 残缺的哈希 (并发 暂停/停止 竞态的遗留)，清理掉并当作无任务
+        await _redis.delete(_ACTIVE_TASK_KEY)
+        return None
+    for field in _TASK_INT_FIELDS:
+        data[field] = int(data[field])
+    return data
+
+# 槽位为空时一次性写入完整哈希：整个占用动作原子完成，
+# 不存在先占 task_id 再补字段之间的半成品窗口
+_CLAIM_IF_EMPTY = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    redis.call('HSET', KEYS[1], unpack(ARGV))
+    return 1
+end
+return 0
+"""
+
+async def _claim_active_task(new_task):
+    """尝试占用活动任务槽位；已被占用时返回 False。
+
+    Redis 模式用 Lua 脚本原子地 检查空槽位+写入完整哈希，
+    两个并发 POST 只有一个能抢到槽位。
+    """
+    if _redis is None:
+        async with _task_lock:
+            if DB["active_task"]:
+                return False
+            DB["active_task"] = new_task
+            return True
+    args = []
+    for k, v in new_task.items():
+        args.append(k)
+        args.append(v.value if isinstance(v, Enum) else v)
+    return bool(await _redis.eval(_CLAIM_IF_EMPTY, 1, _ACTIVE_TASK_KEY, *args))
+
+# 只在任务哈希仍存在时更新 state：裸 HSET 会把并发 STOP 刚删掉的键
+# 重建成只剩 state 字段的残缺哈希
+_SET_STATE_IF_EXISTS = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    redis.call('HSET', KEYS[1], 'state', ARGV[1])
+    return 1
+end
+return 0
+"""
+
+async def _set_active_task_state(state):
+    """更新活动任务的控制状态；任务已不存在时返回 False。"""
+    if _redis is None:
+        if DB["active_task"] is None:
+            return False
+        DB["active_task"]["state"] = state
+        return True
+    return bool(await _redis.eval(_SET_STATE_IF_EXISTS, 1, _ACTIVE_TASK_KEY, state.value))
+
+async def _clear_active_task():
+    """释放活动任务槽位。"""
+    if _redis is None:
+        DB["active_task"] = None
+    else:
+        await _redis.delete(_ACTIVE_TASK_KEY)
 TASK_STEPS = ["等待指令", "抓取物料", "移动至设备1", "执行加工", "移动至设备2", "放置物料", "任务完成"]
 
-def update_db_states():
+# 模拟器可切换的设备状态，固化为模块级常量避免每次调用重建
+_SIM_STATUSES = {"空闲": "success", "运行中": "info", "故障": "error"}
+_SIM_STATUS_KEYS = tuple(_SIM_STATUSES)
+# 数组形式便于掩码索引
+_SIM_STATUS_KEY_ARR = np.array(_SIM_STATUS_KEYS, dtype=object)
+_SIM_STATUS_TYPE_ARR = np.array([_SIM_STATUSES[k] for k in _SIM_STATUS_KEYS], dtype=object)
+
+# 模拟器共用的 NumPy 随机数生成器
+_rng = np.random.default_rng()
+
+# 任务哈希仍存在时才推进计时：读到 RUNNING 之后任务被并发 STOP 删除的话，
+# 裸 HINCRBY 会把键重建成只剩计时字段的残缺哈希
+_TICK_IF_EXISTS = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    redis.call('HINCRBY', KEYS[1], 'total_time', 1)
+    redis.call('HINCRBY', KEYS[1], 'step_time', 1)
+    return 1
+end
+return 0
+"""
+
+async def update_db_states():
     """一个模拟器，随机更新设备和任务状态，让GET请求看起来是动态的"""
-    # 随机更新设备状态
-    for device in DB["devices"]:
-        if random.random() < 0.2: # 20%概率改变状态
-             statuses = {"空闲": "success", "运行中": "info", "故障": "error"}
-             key = random.choice(list(statuses.keys()))
-             device["status"] = key
-             device["type"] = statuses[key]
-        device["value"] = round(random.uniform(0, 100), 1)
+    # 随机更新设备状态：列式存储下整列批量更新，无 Python 循环
+    devices = DB["devices"]
+    mask = _rng.random(_N_DEVICES) < 0.2  # 20%概率改变状态
+    idx = _rng.integers(0, len(_SIM_STATUS_KEYS), _N_DEVICES)
+    devices["status"][mask] = _SIM_STATUS_KEY_ARR[idx[mask]]
+    devices["type"][mask] = _SIM_STATUS_TYPE_ARR[idx[mask]]
+    devices["value"] = np.round(_rng.uniform(0, 100, _N_DEVICES), 1)
 
     # 如果有活动任务，更新其时间
-    if DB["active_task"] and DB["active_task"]["state"] == TaskState.RUNNING:
-        DB["active_task"]["total_time"] += 1
-        DB["active_task"]["step_time"] += 1
+    task = await _get_active_task()
+    if task and task["state"] == TaskState.RUNNING:
+        if _redis is None:
+            task["total_time"] += 1
+            task["step_time"] += 1
+        else:
+            # 每个 worker 都跑 _sim_loop，但任务计时每秒只能走一步：
+            # 用 SET NX EX 1 抢一个1秒的租约，抢到的 worker 才做自增
+            if await _redis.set(_SIM_TICK_KEY, 1, nx=True, ex=1):
+                await _redis.eval(_TICK_IF_EXISTS, 1, _ACTIVE_TASK_KEY)
 
 
 # --- 3. FastAPI 应用和路由定义 ---
@@ -91,38 +188,62 @@ app = FastAPI(
     title="设备监控与任务下发 API",
     description="一个用于设备监控和任务管理的RESTful API。",
     version="1.0.0",
+    default_response_class=ORJSONResponse,  # orjson 的 C 级序列化比标准 json 快数倍
 )
 
+# 设备列表的序列化适配器，预编译一次供热路径复用
+_DEVICE_LIST_ADAPTER = TypeAdapter(List[DeviceStatus])
+
+logger = logging.getLogger(__name__)
+
+# 保留任务引用，避免被垃圾回收、也便于观察
+_sim_task = None
+
+async def _sim_loop():
+    """后台模拟循环：每秒推进一次状态，与请求频率解耦。
+
+    单次 tick 失败 (如 Redis 抖动) 只记录日志，循环不退出。
+    """
+    while True:
+        try:
+            await update_db_states()
+        except Exception:
+            logger.exception("模拟循环 tick 失败")
+        await asyncio.sleep(1)
+
+@app.on_event("startup")
+async def _start_sim():
+    global _sim_task
+    _sim_task = asyncio.create_task(_sim_loop())
+
 @app.get("/api/v1/devices/", response_model=List[DeviceStatus], summary="获取所有设备状态")
-def get_all_devices():
+async def get_all_devices():
     """
     检索系统中所有设备的当前状态列表。
     这个数据用于前端的状态显示面板。
     """
-    update_db_states() # 模拟实时变化
-    return DB["devices"]
+    # 直接用预编译的 TypeAdapter 校验+序列化，跳过 FastAPI 的二次编码
+    payload = _DEVICE_LIST_ADAPTER.dump_json(_DEVICE_LIST_ADAPTER.validate_python(_device_dicts()))
+    return Response(content=payload, media_type="application/json")
 
 @app.get("/api/v1/tasks/active/", response_model=TaskInfo, summary="获取当前活动任务的状态")
-def get_active_task():
+async def get_active_task():
     """
     获取当前正在活动（运行或暂停）的任务的详细信息。
     如果当前没有活动任务，则返回 404 Not Found。
     """
-    update_db_states() # 模拟实时变化
-    if DB["active_task"]:
-        return DB["active_task"]
+    task = await _get_active_task()
+    if task:
+        return task
     raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="当前无活动任务")
 
 
 @app.post("/api/v1/tasks/", response_model=TaskInfo, status_code=status.HTTP_201_CREATED, summary="下发一个新任务")
-def create_task(task: TaskCreate):
+async def create_task(task: TaskCreate):
     """
     创建一个新的任务。如果已有活动任务，会返回 409 Conflict。
     成功后，返回新创建任务的完整信息。
     """
-    if DB["active_task"]:
-        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="已有活动任务正在进行中，请先停止当前任务。")
-
     new_task = {
         "task_id": str(uuid.uuid4()),
         "task_name": task.task_name,
@@ -135,29 +256,63 @@ def create_task(task: TaskCreate):
         "step_time": 0,
         "state": TaskState.RUNNING,
     }
-    DB["active_task"] = new_task
+    if not await _claim_active_task(new_task):
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="已有活动任务正在进行中，请先停止当前任务。")
     return new_task
 
 
 @app.patch("/api/v1/tasks/{task_id}/state/", response_model=TaskInfo, summary="更新任务状态 (暂停/停止)")
-def update_task_state(task_id: str, state_update: TaskStateUpdate):
+async def update_task_state(task_id: str, state_update: TaskStateUpdate):
     """
     根据任务ID更新任务的状态。目前只支持更新为 'paused' 或 'stopped'。
     - **暂停 (paused)**: 任务计时将暂停。
     - **停止 (stopped)**: 任务将从活动任务中移除。
     """
-    if not DB["active_task"] or DB["active_task"]["task_id"] != task_id:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"ID为 {task_id} 的任务不存在或不活动")
+    # 读取-判断-更新 同样要在锁内完成，避免与并发的创建/停止交错
+    async with _task_lock:
+        active_task = await _get_active_task()
+        if not active_task or active_task["task_id"] != task_id:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"ID为 {task_id} 的任务不存在或不活动")
+
+        if state_update.state == TaskState.PAUSED:
+            if not await _set_active_task_state(TaskState.PAUSED):
+                # 其他 worker 恰好停止了任务
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"ID为 {task_id} 的任务不存在或不活动")
+            active_task["state"] = TaskState.PAUSED
+            return active_task
+        elif state_update.state == TaskState.STOPPED:
+            stopped_task = dict(active_task)
+            stopped_task["state"] = TaskState.STOPPED
+            await _clear_active_task()  # 从活动任务中移除
+            return stopped_task
+
+@app.websocket("/ws/dashboard")
+async def dashboard_websocket(websocket: WebSocket):
+    """
+    仪表盘推送通道。每秒主动推送一次设备列表和活动任务，
+    前端无需再按固定间隔轮询 GET 接口。
+    """
+    await websocket.accept()
+    try:
+        while True:
+            await websocket.send_json({
+                "devices": _device_dicts(),
+                "task": await _get_active_task(),
+            })
+            await asyncio.sleep(1)
+    except WebSocketDisconnect:
+        pass
 
-    if state_update.state == TaskState.PAUSED:
-        DB["active_task"]["state"] = TaskState.PAUSED
-        return DB["active_task"]
-    elif state_update.state == TaskState.STOPPED:
-        stopped_task = DB["active_task"].copy()
-        stopped_task["state"] = TaskState.STOPPED
-        DB["active_task"] = None  # 从活动任务中移除
-        return stopped_task
 
 # --- 4. 运行服务器 ---
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    # 装了 uvloop + httptools 时用其替换标准库事件循环和HTTP解析器，否则回退默认。
+    # 多 worker 只在配置了 Redis 时启用：进程内模式下各 worker 不共享任务状态。
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        loop=_UVICORN_LOOP,
+        http=_UVICORN_HTTP,
+        workers=os.cpu_count() if REDIS_URL else 1,
+    )
\ No newline at end of file
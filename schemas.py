@@ -7,7 +7,7 @@ LastEditTime: 2025-06-12 23:43:26
 '''
 # schemas.py
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
 from typing import List, Optional
 from enum import Enum
 import uuid